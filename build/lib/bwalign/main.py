@@ -1,4 +1,5 @@
 from bwalign import utils
+from itertools import chain
 import pysam
 import argparse
 
@@ -6,12 +7,14 @@ def main():
     parser = argparse.ArgumentParser(description="Run BWA alignment with specified reference genome and FASTQ file.")
     parser.add_argument("reference_genome", type=str, help="Path to the reference genome file")
     parser.add_argument("fastq_file", type=str, help="Path to the FASTQ file")
+    parser.add_argument("--index_dir", type=str, default=".bwalign_index", help="Directory the reference index is cached in")
     args = parser.parse_args()
     
-    # Parse the FASTQ file
+    # Stream the FASTQ file, peeking at the first read for the read length
     reads = utils.parse_fastq(args.fastq_file)
-    _, first_read, _ = reads[0]
-    read_length = len(first_read)
+    first = next(reads)
+    read_length = len(first[1])
+    reads = chain([first], reads)
     
     # Parse the reference genome
     ref_id, reference = utils.parse_reference_genome(args.reference_genome)
@@ -19,11 +22,8 @@ def main():
     #BWT and SA
     K = 5
     ref_text = str(reference) + '$'
-    bwt = utils.burrows_wheeler_transform(ref_text)
-    psa = utils.partial_suffix_array(ref_text, K)
-    first_occurrences = utils.compute_first_occurrences(bwt)
-    checkpoint_arrs = utils.compute_checkpoint_arrs(bwt)
-    ranks = utils.compute_rank_arr(bwt)
+    bwt_arr, first_occurrences, is_sampled, psa_values, checkpoint_arrs, ranks = \
+        utils.build_or_load_index(ref_text, args.index_dir, K)
     
     #header for the SAM file (based on ref)
     header = {
@@ -35,7 +35,7 @@ def main():
     with pysam.AlignmentFile("output.sam", "w", header=header) as samfile:
         for read_id, read_seq, qual_scores in reads:
             
-            seed_idxes = utils.generate_seeds(str(read_seq), bwt, 8, psa, first_occurrences, checkpoint_arrs, ranks)
+            seed_idxes = utils.generate_seeds(str(read_seq), bwt_arr, 8, is_sampled, psa_values, first_occurrences, checkpoint_arrs, ranks)
             best_idx, score, alignment_s, alignment_t = utils.compute_max_seed(str(reference), str(read_seq), seed_idxes, 2, 1, 2, 1, read_length)
 
             #create a SAM entry for the aligned read
@@ -47,7 +47,7 @@ def main():
             a.reference_start = best_idx
             a.mapping_quality = 60
             a.cigarstring = f"{len(alignment_s.replace('-', ''))}M"
-            a.query_qualities = qual_scores
+            a.query_qualities = pysam.qualitystring_to_array(qual_scores.decode('ascii'))
             
             samfile.write(a)
 
@@ -1,93 +1,206 @@
-from Bio import SeqIO
-from typing import List, Tuple
-import sys
+from concurrent.futures import ThreadPoolExecutor
+import dnaio
+import functools
+import hashlib
+from itertools import repeat
+from typing import Iterator, List, Tuple
+import numba
+from numba.typed import List as TypedList
+import numpy as np
+import os
+import parasail
+from pydivsufsort import divsufsort
+import pyfastx
+import shutil
 
 ### AFFINE ALIGNMENT
 
+NEG_INF = -30000 # int16 stand-in for float('-inf'), every score saturates here, leaving room to subtract penalties without wrapping
+NEG_INF_32 = -(1 << 30) # int32 stand-in, for alignments whose scores could reach NEG_INF in int16
+
+# backtrack pointers of all three matrices are packed into one uint8 per cell, 2 bits per matrix:
+# lower in bits 0-1, upper in bits 2-3, middle in bits 4-5.
+LOW_D, LOW_OPEN = 1, 2
+UP_R, UP_OPEN = 1, 2
+MID_INCLOSE, MID_DELCLOSE, MID_DR = 1, 2, 3
+
+TILE = 16 # rows per strip of the DP, keeps the live diagonals and the backtrack rows being written in L1
+
+@numba.njit(cache=True, boundscheck=False, nogil=True)
+def _affine_fill(match, go, ge, neg_inf):
+    """
+    Fills the lower/upper/middle matrices from the (len(s), len(t)) match score matrix, returns the score and the packed backtrack matrix.
+    The matrices are filled in strips of TILE rows. Within a strip, cells are visited one anti-diagonal at a time, and every
+    cell on a diagonal only depends on the previous two diagonals, so the inner loop has no loop-carried dependency and can
+    be vectorized. Only the last row of the previous strip and three diagonals of the current strip are ever kept.
+    Scores are kept in the dtype of match, and saturate at neg_inf.
+    """
+    n_s, n_t = match.shape
+    # last row of the previous strip, starting from the base cases of row 0. base for lower and upper is -infinity.
+    lower_row, upper_row, middle_row = np.empty(n_t + 1, dtype=match.dtype), np.empty(n_t + 1, dtype=match.dtype), np.empty(n_t + 1, dtype=match.dtype)
+    lower_row[0], upper_row[0], middle_row[0] = neg_inf, neg_inf, 0
+    for j in range(1, n_t + 1):
+        lower_row[j], upper_row[j], middle_row[j] = neg_inf, 0, max(neg_inf, -go - ((j-1) * ge))
+    # rolling diagonals of the strip for the insertions (lower), deletions (upper) and match/mismatch (middle) matrices,
+    # indexed by row within the strip.
+    lower_prev1, lower_curr = np.empty(TILE + 1, dtype=match.dtype), np.empty(TILE + 1, dtype=match.dtype)
+    upper_prev1, upper_curr = np.empty(TILE + 1, dtype=match.dtype), np.empty(TILE + 1, dtype=match.dtype)
+    middle_prev2, middle_prev1, middle_curr = np.empty(TILE + 1, dtype=match.dtype), np.empty(TILE + 1, dtype=match.dtype), np.empty(TILE + 1, dtype=match.dtype)
+    bt = np.zeros((n_s, n_t), dtype=np.uint8) # packed backtrack of insertions, deletions and ms/mms
+    for r0 in range(0, n_s, TILE):
+        h = min(TILE, n_s - r0)
+        for k in range(0, h + n_t + 1):
+            ii_lo, ii_hi = max(0, k - n_t), min(h, k)
+            if ii_lo == 0: # cell (r0, k), the strip's top row
+                lower_curr[0], upper_curr[0], middle_curr[0] = lower_row[k], upper_row[k], middle_row[k]
+            if ii_hi == k and k > 0: # cell (r0 + k, 0), base case of middle uses gap opening and extension penalties
+                lower_curr[k], upper_curr[k], middle_curr[k] = 0, neg_inf, max(neg_inf, -go - ((r0 + k - 1) * ge))
+            for ii in range(max(1, ii_lo), min(ii_hi, k - 1) + 1):
+                i, j = r0 + ii, k - ii
+                low = max(neg_inf, max(lower_prev1[ii-1] - ge, middle_prev1[ii-1] - go))
+                up = max(neg_inf, max(upper_prev1[ii] - ge, middle_prev1[ii] - go))
+                mid = max(low, up, middle_prev2[ii-1] + match[i-1, j-1])
+                b_low = LOW_D if low == lower_prev1[ii-1] - ge else LOW_OPEN
+                b_up = UP_R if up == upper_prev1[ii] - ge else UP_OPEN
+                if mid == low:
+                    b_mid = MID_INCLOSE
+                elif mid == up:
+                    b_mid = MID_DELCLOSE
+                else:
+                    b_mid = MID_DR
+                bt[i-1, j-1] = b_low | (b_up << 2) | (b_mid << 4)
+                lower_curr[ii], upper_curr[ii], middle_curr[ii] = low, up, mid
+            if ii_hi == h: # cell (r0 + h, k - h), the strip's bottom row becomes the next strip's top row
+                lower_row[k - h], upper_row[k - h], middle_row[k - h] = lower_curr[h], upper_curr[h], middle_curr[h]
+            lower_prev1, lower_curr = lower_curr, lower_prev1
+            upper_prev1, upper_curr = upper_curr, upper_prev1
+            middle_prev2, middle_prev1, middle_curr = middle_prev1, middle_curr, middle_prev2
+    score = max(lower_row[n_t], middle_row[n_t], upper_row[n_t])
+    return score, bt
+
+_affine_fill_inline = numba.njit(inline='always', boundscheck=False, nogil=True)(_affine_fill.py_func)
+
+@functools.lru_cache(maxsize=8) # every kernel is a fresh compile, so only a few shapes are kept around
+def _make_affine(m: int, n: int, mr: int, mp: int, go: int, ge: int, dtype: type, neg_inf: int):
+    """
+    Returns an _affine_fill kernel specialized on one (m, n) shape and one set of scoring parameters,
+    which Numba compiles as constants so the loop bounds and penalties are folded into the kernel.
+    """
+    @numba.njit(boundscheck=False, nogil=True)
+    def kern(s_arr, t_arr):
+        match = np.empty((m, n), dtype=dtype)
+        for i in range(m):
+            for j in range(n):
+                match[i, j] = mr if s_arr[i] == t_arr[j] else -mp
+        return _affine_fill_inline(match, go, ge, neg_inf)
+    return kern
+
+def _score_type(match_reward: int, mismatch_penalty: int,
+                gap_opening_penalty: int, gap_extension_penalty: int, m: int, n: int) -> tuple[type, int]:
+    """
+    Returns the score dtype and its NEG_INF for aligning an m long string against an n long one.
+    No alignment scores more than (m + n) times the largest parameter either way, so int16 is
+    used whenever that stays above NEG_INF, and int32 otherwise.
+    """
+    largest = max(match_reward, mismatch_penalty, gap_opening_penalty, gap_extension_penalty)
+    if largest * (m + n) < -NEG_INF:
+        return np.int16, NEG_INF
+    return np.int32, NEG_INF_32
+
 def AffineAlignment(match_reward: int, mismatch_penalty: int,
                     gap_opening_penalty: int, gap_extension_penalty: int,
-                    s: str, t: str) -> tuple[int, str, str]:
-    """Generates the affine alignment of two strings s and t."""
-    sys.setrecursionlimit(1500)
-    lower = [[0] * (len(t) + 1) for _ in range(len(s) + 1)] # insertions matrix
-    upper = [[0] * (len(t) + 1) for _ in range(len(s) + 1)] # deletions matrix
-    middle = [[0] * (len(t) + 1) for _ in range(len(s) + 1)] # match/mismatch matrix
-    b_lower = [[None] * (len(t)) for _ in range(len(s))] # backtrack insertions
-    b_upper = [[None] * (len(t)) for _ in range(len(s))] # backtrack deletions
-    b_middle = [[None] * (len(t)) for _ in range(len(s))] # backtrack ms/mms
-    for i in range(0, len(s) + 1):
-        for j in range(0, len(t) + 1):
-            # set base cases for middle using gap opening and extension penalties, base for lower and upper is -infinity.
-            if i == 0 and j == 0:
-                lower[i][j], upper[i][j] = float('-inf'), float('-inf')
-                continue
-            elif i == 0:
-                lower[i][j], middle[i][j] = float('-inf'), -gap_opening_penalty - ((j-1) * gap_extension_penalty)
-                continue
-            elif j == 0:
-                upper[i][j], middle[i][j] = float('-inf'), -gap_opening_penalty - ((i-1) * gap_extension_penalty)
-                continue
-            
-            # test for match
-            match = -mismatch_penalty
-            if s[i-1] == t[j-1]:
-                match = match_reward
-            
-            lower[i][j] = max(lower[i-1][j] - gap_extension_penalty, middle[i-1][j] - gap_opening_penalty)
-            upper[i][j] = max(upper[i][j-1] - gap_extension_penalty, middle[i][j-1] - gap_opening_penalty)
-            middle[i][j] = max(lower[i][j], upper[i][j], middle[i-1][j-1] + match)
-            if lower[i][j] == lower[i-1][j] - gap_extension_penalty:
-                b_lower[i-1][j-1] = 'd'
-            elif lower[i][j] == middle[i-1][j] - gap_opening_penalty:
-                b_lower[i-1][j-1] = 'open'
-            if upper[i][j] == upper[i][j-1] - gap_extension_penalty:
-                b_upper[i-1][j-1] = 'r'
-            elif upper[i][j] == middle[i][j-1] - gap_opening_penalty:
-                b_upper[i-1][j-1] = 'open'
-            if middle[i][j] == lower[i][j]:
-                b_middle[i-1][j-1] = 'in_close'
-            elif middle[i][j] == upper[i][j]:
-                b_middle[i-1][j-1] = 'del_close'
-            elif middle[i][j] == middle[i-1][j-1] + match:
-                b_middle[i-1][j-1] = 'dr'
-    s_align, t_align = backtrack(s, t, b_lower, b_upper, b_middle, len(s) - 1, len(t) - 1, 'middle')
-    return max(lower[len(s)][len(t)], middle[len(s)][len(t)], upper[len(s)][len(t)]), s_align, t_align
+                    s: str, t: str, specialize: bool = False) -> tuple[int, str, str]:
+    """
+    Generates the affine alignment of two strings s and t. With specialize, the DP runs in a kernel
+    compiled for exactly this shape and these scores, worth it when the same shape repeats all run.
+    """
+    s_arr = np.frombuffer(s.encode('ascii'), dtype=np.uint8)
+    t_arr = np.frombuffer(t.encode('ascii'), dtype=np.uint8)
+    dtype, neg_inf = _score_type(match_reward, mismatch_penalty, gap_opening_penalty,
+                                 gap_extension_penalty, len(s), len(t))
+    if specialize:
+        kern = _make_affine(len(s), len(t), match_reward, mismatch_penalty,
+                            gap_opening_penalty, gap_extension_penalty, dtype, neg_inf)
+        score, bt = kern(s_arr, t_arr)
+    else:
+        # score every pair of positions at once instead of comparing characters cell by cell.
+        match = np.where(s_arr[:, None] == t_arr[None, :], match_reward, -mismatch_penalty).astype(dtype)
+        score, bt = _affine_fill(match, gap_opening_penalty, gap_extension_penalty, neg_inf)
+    s_out: list[str] = []
+    t_out: list[str] = []
+    backtrack(s, t, bt, len(s) - 1, len(t) - 1, 'middle', s_out, t_out)
+    # backtrack appends the alignments back to front, so they are reversed once here.
+    return int(score), ''.join(reversed(s_out)), ''.join(reversed(t_out))
                 
-def backtrack(s: str, t: str, b_lower: list[list[str]], b_upper: list[list[str]], b_middle: list[list[str]], i: int, j: int, LEVEL: str) -> tuple[str,str]:
-    if i < 0 and j < 0: # if both i and j reach -1 at the same time, we can just return empty string.
-        return '',''
-    elif i < 0: # if i reaches -1 first, need to append the rest of t up to index j to t prime, and a number of '-' equal to the length of that string to s prime.
-        return '-' * (j + 1), t[0:j+1]
-    elif j < 0: # same as i < 0 condition but for j.
-        return s[0:i+1], '-' * (i + 1)
-    # my use of the LEVEL variable tells us which matrix this call is backtracking in.
-    if LEVEL == 'middle':
-        if b_middle[i][j] == 'in_close':
-            s_prime, t_prime = backtrack(s, t, b_lower, b_upper, b_middle, i, j, 'lower')
-            return s_prime, t_prime
-        elif b_middle[i][j] == 'del_close':
-            s_prime, t_prime = backtrack(s, t, b_lower, b_upper, b_middle, i, j, 'upper')
-            return s_prime, t_prime
-        elif b_middle[i][j] == 'dr':
-            s_prime, t_prime = backtrack(s, t, b_lower, b_upper, b_middle, i-1, j-1, 'middle')
-            return s_prime + s[i], t_prime + t[j]
-    elif LEVEL == 'lower':
-        if b_lower[i][j] == 'd':
-            s_prime, t_prime = backtrack(s, t, b_lower, b_upper, b_middle, i-1, j, 'lower')
-            return s_prime + s[i], t_prime + '-'
-        elif b_lower[i][j] == 'open':
-            s_prime, t_prime = backtrack(s, t, b_lower, b_upper, b_middle, i-1, j, 'middle')
-            return s_prime + s[i], t_prime + '-'
-    elif LEVEL == 'upper':
-        if b_upper[i][j] == 'r':
-            s_prime, t_prime = backtrack(s, t, b_lower, b_upper, b_middle, i, j-1, 'upper')
-            return s_prime + '-', t_prime + t[j]
-        elif b_upper[i][j] == 'open':
-            s_prime, t_prime = backtrack(s, t, b_lower, b_upper, b_middle, i, j-1, 'middle')
-            return s_prime + '-', t_prime + t[j]
+def backtrack(s: str, t: str, bt: np.ndarray, i: int, j: int, LEVEL: str, s_out: list[str], t_out: list[str]) -> None:
+    # the alignments of s and t are appended to the caller's s_out and t_out back to front.
+    # my use of the LEVEL variable tells us which matrix we are backtracking in.
+    while i >= 0 and j >= 0:
+        code = bt[i, j]
+        if LEVEL == 'middle':
+            mid = (code >> 4) & 3
+            if mid == MID_INCLOSE:
+                LEVEL = 'lower'
+            elif mid == MID_DELCLOSE:
+                LEVEL = 'upper'
+            else:
+                s_out.append(s[i])
+                t_out.append(t[j])
+                i, j = i - 1, j - 1
+        elif LEVEL == 'lower':
+            if (code & 3) == LOW_OPEN:
+                LEVEL = 'middle'
+            s_out.append(s[i])
+            t_out.append('-')
+            i -= 1
+        else:
+            if ((code >> 2) & 3) == UP_OPEN:
+                LEVEL = 'middle'
+            s_out.append('-')
+            t_out.append(t[j])
+            j -= 1
+    if i < 0: # if i reaches -1 first, the rest of t up to index j is aligned against '-' in s.
+        s_out.extend(['-'] * (j + 1))
+        t_out.extend(reversed(t[0:j+1]))
+    else: # same as i < 0 condition but for j.
+        s_out.extend(reversed(s[0:i+1]))
+        t_out.extend(['-'] * (i + 1))
 
 ### SEED EXTENSION
 
+# ascii -> ACGTN. parasail's matrices ignore case and score letters outside their alphabet their own way,
+# so every sequence is mapped into ACGTN first and both parasail and AffineAlignment compare the same letters.
+_ACGTN = bytes.maketrans(bytes(range(256)), bytes(c if c in b'ACGT' else ord('N') for c in range(256)))
+
+N_WORKERS = os.cpu_count() or 1
+MIN_PARALLEL_SEGMENTS = 256 # below this many segments, handing them to the pool costs more than scoring them
+_executor = ThreadPoolExecutor(max_workers=N_WORKERS) # shared by every read, threads are started on first use
+
+def to_acgtn(seq: str) -> str:
+    """Maps every symbol of seq other than (uppercase) A, C, G and T to N."""
+    return seq.encode('ascii').translate(_ACGTN).decode('ascii')
+
+def score_segments(profile, read: str, segments: list[str],
+                   match_reward: int, mismatch_penalty: int,
+                   gap_opening_penalty: int, gap_extension_penalty: int) -> list[int]:
+    """
+    Scores each reference segment against the read's parasail profile, releasing the GIL while aligning.
+    parasail's striped kernels miscount gaps unless opening a gap costs more than extending one, so
+    linear gap penalties are scored with AffineAlignment instead.
+    """
+    striped = gap_opening_penalty > gap_extension_penalty
+    scores = []
+    for ref_segment in segments:
+        if striped and ref_segment: # parasail needs a non-empty segment
+            scores.append(parasail.nw_striped_profile_sat(profile, ref_segment, gap_opening_penalty,
+                                                          gap_extension_penalty).score)
+        else:
+            score, _, _ = AffineAlignment(match_reward, mismatch_penalty,
+                                          gap_opening_penalty, gap_extension_penalty,
+                                          ref_segment, read)
+            scores.append(score)
+    return scores
+
 def compute_max_seed(ref: str, read: str, seed_idxes: list[list[int]],
                      match_reward: int, mismatch_penalty: int,
                      gap_opening_penalty: int, gap_extension_penalty: int,
@@ -98,191 +211,288 @@ def compute_max_seed(ref: str, read: str, seed_idxes: list[list[int]],
     will be between the entire read and a length 50 segment of the reference starting at
     the calculated position. Version 2 of this function now also returns the alignments 
     themselves of the read and respective 50 base segment of the ref genome.
+    Version 3 scores every segment against a single parasail query profile of the read
+    (SIMD across the DP), and only backtracks the best segment with AffineAlignment.
+    Version 4 spreads the segments over a shared thread pool, one chunk of segments per core,
+    once there are enough of them to be worth it.
+    The read and the segments are mapped into ACGTN (see to_acgtn) for scoring and backtracking.
     """
+    read = to_acgtn(read)
+    matrix = parasail.matrix_create("ACGTN", match_reward, -mismatch_penalty)
+    profile = parasail.profile_create_sat(read, matrix) # 8-bit lanes, retried at 16 then 32 bits on overflow
+    # flatten the seeds into (seed, ref_idx) tasks and slice every segment up front in this thread.
+    tasks = [(i, ref_idx) for i in range(0, len(seed_idxes)) for ref_idx in seed_idxes[i]]
+    segments = [to_acgtn(ref[ref_idx - i:ref_idx - i + read_length]) for i, ref_idx in tasks]
+    if len(segments) < MIN_PARALLEL_SEGMENTS:
+        scores = score_segments(profile, read, segments, match_reward, mismatch_penalty,
+                                gap_opening_penalty, gap_extension_penalty)
+    else:
+        chunk = -(-len(segments) // N_WORKERS)
+        chunk_scores = _executor.map(score_segments, repeat(profile), repeat(read),
+                                     [segments[c:c + chunk] for c in range(0, len(segments), chunk)],
+                                     repeat(match_reward), repeat(mismatch_penalty),
+                                     repeat(gap_opening_penalty), repeat(gap_extension_penalty))
+        scores = [score for scores in chunk_scores for score in scores]
     best_score = float('-inf')
     best_idx = -1
-    s_best_align = ''
-    t_best_align = ''
-    for i in range(0, len(seed_idxes)):
-        for ref_idx in seed_idxes[i]:
-            ref_segment = ref[ref_idx - i:ref_idx - i + read_length]
-            score, s_align, t_align, = AffineAlignment(match_reward, mismatch_penalty, 
-                                            gap_opening_penalty, gap_extension_penalty,
-                                            ref_segment, read)
-            if score > best_score:
-                best_score = score
-                best_idx = ref_idx
-                s_best_align = s_align
-                t_best_align = t_align
+    best_segment = None
+    for (_, ref_idx), ref_segment, score in zip(tasks, segments, scores):
+        if score > best_score:
+            best_score = score
+            best_idx = ref_idx
+            best_segment = ref_segment
+    if best_segment is None:
+        return best_idx, best_score, '', ''
+    # only the best segment is ever backtracked, so the shared cached kernel is used rather than one compiled per shape.
+    _, s_best_align, t_best_align = AffineAlignment(match_reward, mismatch_penalty,
+                                                    gap_opening_penalty, gap_extension_penalty,
+                                                    best_segment, read)
     return best_idx, best_score, s_best_align, t_best_align
 
 ### SEED GENERATION
 
-def burrows_wheeler_transform(text: str) -> str:
+SEED_IDXES_TYPE = numba.types.int32[::1] # one array of reference positions per kmer
+# ascii -> A=0, C=1, G=2, T=3, $=4, then N and the other IUPAC codes, then every other byte. Symbols
+# outside ACGT$ keep their own codes, and the checkpoints only get columns up to the largest code present.
+SYMBOLS = b'ACGT$NRYKMSWBDHV'
+ENCODE = np.argsort(np.frombuffer(SYMBOLS + bytes(b for b in range(256) if b not in SYMBOLS), dtype=np.uint8)).astype(np.uint8)
+
+def suffix_array(text: str) -> np.ndarray:
+    """
+    Generate the suffix array of the given text with libdivsufsort, O(n log n) time and O(n) memory.
+    """
+    return divsufsort(text.encode('ascii'))
+
+def burrows_wheeler_transform(text: str, sa: np.ndarray = None) -> str:
     """
-    Generate the Burrows-Wheeler Transform of the given text.
+    Generate the Burrows-Wheeler Transform of the given text. The text must end with the '$'
+    sentinel, so sorting its cyclic rotations is the same as sorting its suffixes, and the
+    last character of each rotation is the character preceding its suffix. A suffix array
+    already built for the text can be passed in as sa so it is not sorted again.
     """
-    cyclic_rotations = []
-    for i in range(0,len(text)):
-        cyclic_rotations.append(text[i:] + text[:i])
-    M = sorted(cyclic_rotations)
-    bwt = ''
-    for rotation in M:
-        bwt = bwt + rotation[len(rotation)-1]
-    return bwt
+    text_arr = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+    if sa is None:
+        sa = suffix_array(text)
+    return text_arr[sa - 1].tobytes().decode('ascii') # sa == 0 wraps around to the '$' at text[-1]
 
-def partial_suffix_array(text: str, k: int) -> dict[int, int]:
+def partial_suffix_array(sa: np.ndarray, k: int) -> dict[int, int]:
     """
-    Generate a partial suffix array for the given text and interval K.
+    Generate a partial suffix array with interval K from the full suffix array of the text.
     """
-    full_suffix_array = sorted(range(len(text)), key=lambda i: text[i:]) # taken from Nabil's bw code
-    partial = dict()
-    for idx in full_suffix_array:
-        if full_suffix_array[idx] % k == 0:
-            partial[idx] = full_suffix_array[idx]
-    return partial
+    # keep row i -> text position sa[i] for every row whose position is a multiple of k.
+    rows = np.flatnonzero(sa % k == 0)
+    return dict(zip(rows.tolist(), sa[rows].tolist()))
 
-def compute_rank_arr(bwt: str) -> list[int]:
+@numba.njit(cache=True)
+def compute_rank_arr(bwt_arr: np.ndarray) -> np.ndarray:
     """
     This function generates the rank of each position in the last column given by the bwt.
     The rank is the number of occurrences of whatever character is at that position, up to
-    that position. This can be done in linear time by iterating through the bwt. The ranks
-    will be returned in the form of a list of ranks, obviously indices will be in-built.
-    """
-    rank = []
-    counts = dict()
-    for char in bwt:
-        if char not in counts: counts[char] = 0
-        counts[char] += 1
-        rank.append(counts[char])
+    that position. This can be done in linear time by iterating through the encoded bwt. The ranks
+    will be returned in the form of an int32 array of ranks, obviously indices will be in-built.
+    """
+    rank = np.empty(len(bwt_arr), dtype=np.int32)
+    counts = np.zeros(256, dtype=np.int32)
+    for i in range(0, len(bwt_arr)):
+        counts[bwt_arr[i]] += 1
+        rank[i] = counts[bwt_arr[i]]
     return rank
 
-def compute_first_occurrences(bwt: str) -> dict[str, int]: # the mapping of c in C is the row at which the character c appears in the first column for the first time.
+def compute_first_occurrences(bwt_arr: np.ndarray) -> np.ndarray: # the mapping of c in C is the row at which the character c appears in the first column for the first time.
+    """
+    Generate an int32 array where each symbol code is mapped to the index in first column where
+    these characters first appeared. Because the first column is in lexicographic order, a
+    cumulative sum of the symbol counts in the last column, taken in ascii order
+    ($ < A < C < G < N < T ...), gives the start of each symbol's block. This is done in linear time.
+    """
+    counts = np.bincount(bwt_arr, minlength=256)
+    lexical = ENCODE[np.arange(256)] # codes in ascii order, '$' sorts before the bases but is encoded after them
+    first_occ = np.empty(256, dtype=np.int32)
+    first_occ[lexical[0]] = 0
+    first_occ[lexical[1:]] = np.cumsum(counts[lexical[:-1]])
+    return first_occ
+
+def encode_bwt(bwt: str) -> np.ndarray:
     """
-    Generate a dict where each 'character' is mapped to the index in first column where
-    these characters first appeared. In other words because the first column is in alphabetical
-    order, we can count the ascii code of each character in the last column, then iterate
-    from 0 to 255 to get the count of each ascii character in ascending lexicographic order.
-    This is done in linear time.
+    Encode the bwt as one uint8 symbol code per position (A=0, C=1, G=2, T=3, $=4, N=5, ...).
     """
-    C = dict()
-    counts = [0 for _ in range(256)]
-    for char in bwt:
-        C[char] = 0
-        counts[ord(char)] += 1
-    curr_idx = 0
-    for i in range(0,256):
-        if counts[i] != 0:
-            C[chr(i)] = curr_idx
-        for _ in range(counts[i]):
-            curr_idx += 1
-    return C
+    return ENCODE[np.frombuffer(bwt.encode('ascii'), dtype=np.uint8)]
 
-def compute_checkpoint_arrs(bwt: str) -> dict[int, list[int]]:
+def compute_checkpoint_arrs(bwt_arr: np.ndarray) -> np.ndarray:
     """
-    Similar to ranks, but instead the list stored contains the rank of every character up to
-    that index, if the index % C is 0. More memory efficient.
+    Similar to ranks, but instead the row stored contains the rank of every symbol up to
+    that index, if the index % C is 0. More memory efficient. Row i // C holds the
+    checkpoint of index i, one int32 column per symbol code up to the largest one in the bwt
+    (ACGT$, plus N onwards only when the reference has them).
     """
     C = 5
-    ranks = dict()
-    rank = [0 for _ in range(256)]
-    for i in range(0, len(bwt)):
-        rank[ord(bwt[i])] += 1
+    n_symbols = max(5, int(bwt_arr.max(initial=0)) + 1) # always a column for each of ACGT$
+    return _checkpoint_arrs(bwt_arr, C, n_symbols)
+
+@numba.njit(cache=True)
+def _checkpoint_arrs(bwt_arr, C, n_symbols):
+    ranks = np.zeros(((len(bwt_arr) + C - 1) // C, n_symbols), dtype=np.int32)
+    rank = np.zeros(n_symbols, dtype=np.int32)
+    for i in range(0, len(bwt_arr)):
+        rank[bwt_arr[i]] += 1
         if i % C == 0:
-            ranks[i] = rank[:]
+            ranks[i // C] = rank
     return ranks
 
-def compute_rank(bwt: str, idx: int, ranks: dict[int, list[int]], symbol: str, C: int) -> int: # idx can be either top or bot
-    idx_dist_from_chkpnt = idx % C
-    idx_rank = ranks[idx - idx_dist_from_chkpnt][ord(symbol)]
-    for j in range(idx - idx_dist_from_chkpnt + 1, idx + 1):
-        if bwt[j] == symbol:
+@numba.njit(cache=True)
+def compute_rank(bwt_arr: np.ndarray, idx: int, ranks: np.ndarray, sym: int, C: int) -> int: # idx can be either top or bot
+    chkpnt = idx // C
+    idx_rank = ranks[chkpnt, sym]
+    for j in range(chkpnt * C + 1, idx + 1): # at most C - 1 symbols past the checkpoint
+        if bwt_arr[j] == sym:
             idx_rank += 1
     return idx_rank
 
-def bw_better_match_pattern(bwt: str, pattern: str, first_occurrences: dict[str,int], ranks: list[list[int]]) -> tuple[int,int]:
-    C = 5
+@numba.njit(cache=True)
+def _match_pattern(bwt_arr, pattern_arr, first_occurrences, ranks, C):
     top = 0
-    bot = len(bwt) - 1
-    for i in range(len(pattern) - 1, -1, -1):
-        symbol = pattern[i]
-        if symbol not in first_occurrences: # in the case the symbol is not in text at all
+    bot = len(bwt_arr) - 1
+    for i in range(len(pattern_arr) - 1, -1, -1):
+        sym = pattern_arr[i]
+        if sym >= ranks.shape[1]: # in the case the symbol is not in text at all
             return (0,0)
-        top_rank = compute_rank(bwt, top, ranks, symbol, C) # use checkpoint arrs to get the rank
-        bot_rank = compute_rank(bwt, bot, ranks, symbol, C)
+        first_occurrence = first_occurrences[sym]
+        top_rank = compute_rank(bwt_arr, top, ranks, sym, C) # use checkpoint arrs to get the rank
+        bot_rank = compute_rank(bwt_arr, bot, ranks, sym, C)
         marker = False
-        if bwt[top] == symbol:
+        if bwt_arr[top] == sym:
             marker = True
-        top = first_occurrences[symbol] + top_rank
+        top = first_occurrence + top_rank
         if marker:
             top -= 1
-        bot = first_occurrences[symbol] + bot_rank - 1
+        bot = first_occurrence + bot_rank - 1
         if bot - top < 0:
             return (0,0)
     return (top, bot + 1)
 
-def compute_idxes_from_top_bot(start: int, end: int, partial_s_array: dict[int, int], bwt: str, rank: list[int], occurrences: list[int]) -> list[int]:
-    pattern_idxes = []
-    for i in range(start, end):
-        p = i
-        plus_count = 0
-        while True:
-            predecessor = bwt[p]
-            p = occurrences[predecessor] + rank[p] - 1
-            plus_count += 1
-            if p in iter(partial_s_array.keys()):
-                break
-        pattern_idxes.append((partial_s_array[p] + plus_count) % len(bwt))
-    return pattern_idxes
-
-def generate_seeds(read: str, bwt: str, k: int, psa: dict[int, int],
-                                                first_occurrences: dict[str, int],
-                                                checkpoint_arrs: dict[int, list[int]],
-                                                ranks: list[int]) -> list[list[int]]:
+def bw_better_match_pattern(bwt_arr: np.ndarray, pattern: str, first_occurrences: np.ndarray, ranks: np.ndarray) -> tuple[int,int]:
+    C = 5
+    pattern_arr = ENCODE[np.frombuffer(pattern.encode('ascii'), dtype=np.uint8)]
+    return _match_pattern(bwt_arr, pattern_arr, first_occurrences, ranks, C)
+
+def partial_suffix_arrs(psa: dict[int, int], n: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Spread the partial suffix array dict over two dense length n arrays, a bitmap of the
+    sampled rows and the text position of each sampled row (-1 elsewhere).
+    """
+    is_sampled = np.zeros(n, dtype=np.bool_)
+    psa_values = np.full(n, -1, dtype=np.int32)
+    rows = np.fromiter(psa.keys(), dtype=np.int64, count=len(psa))
+    is_sampled[rows] = True
+    psa_values[rows] = np.fromiter(psa.values(), dtype=np.int32, count=len(psa))
+    return is_sampled, psa_values
+
+@numba.njit(cache=True)
+def _recover(start, end, bwt_arr, rank_arr, first_occ, is_sampled, psa_values, n):
+    out = np.empty(end - start, dtype=np.int32)
+    for k in range(start, end):
+        p = k
+        plus = 0
+        while not is_sampled[p]: # LF-map back to the nearest sampled row
+            pred = bwt_arr[p]
+            p = first_occ[pred] + rank_arr[p] - 1
+            plus += 1
+        out[k - start] = (psa_values[p] + plus) % n
+    return out
+
+def compute_idxes_from_top_bot(start: int, end: int, is_sampled: np.ndarray, psa_values: np.ndarray,
+                               bwt_arr: np.ndarray, rank_arr: np.ndarray, first_occ: np.ndarray) -> list[int]:
+    return _recover(start, end, bwt_arr, rank_arr, first_occ, is_sampled, psa_values, len(bwt_arr)).tolist()
+
+@numba.njit(cache=True)
+def _generate_seeds(read_arr, bwt_arr, k, is_sampled, psa_values, first_occurrences, checkpoint_arrs, ranks, C):
+    seed_idxes = TypedList.empty_list(SEED_IDXES_TYPE)
+    for i in range(0, len(read_arr) - k + 1):
+        start, end = _match_pattern(bwt_arr, read_arr[i:i+k], first_occurrences, checkpoint_arrs, C)
+        seed_idxes.append(_recover(start, end, bwt_arr, ranks, first_occurrences, is_sampled, psa_values, len(bwt_arr)))
+    return seed_idxes
+
+def generate_seeds(read: str, bwt_arr: np.ndarray, k: int, is_sampled: np.ndarray, psa_values: np.ndarray,
+                                                first_occurrences: np.ndarray,
+                                                checkpoint_arrs: np.ndarray,
+                                                ranks: np.ndarray) -> list[list[int]]:
     """
     Takes a read and bwt created from reference genome, and generates a list of lists
     with each index being an index i in the read from 0 to len(read) - k + 1. The corresponding list at each
     index is a list of exact match indices of the kmer at read[i:i+k] located in the reference
     genome. Note that even if two kmers are identical, their indices in the read are not.
+    Every kmer is matched and located inside one JIT call over the encoded read.
     """
-    seed_idxes = []
-    for i in range(0, len(read) - k + 1):
-        kmer = read[i:i+k]
-        start, end = bw_better_match_pattern(bwt, kmer, first_occurrences, checkpoint_arrs)
-        idxes = compute_idxes_from_top_bot(start, end, psa, bwt, ranks, first_occurrences)
-        seed_idxes.append(idxes)
-    return seed_idxes
+    C = 5
+    read_arr = ENCODE[np.frombuffer(read.encode('ascii'), dtype=np.uint8)]
+    seed_idxes = _generate_seeds(read_arr, bwt_arr, k, is_sampled, psa_values,
+                                 first_occurrences, checkpoint_arrs, ranks, C)
+    return [idxes.tolist() for idxes in seed_idxes]
+
+INDEX_ARRAYS = ('bwt_arr', 'first_occurrences', 'is_sampled', 'psa_values', 'checkpoint_arrs', 'ranks')
+
+def build_or_load_index(ref: str, cache_dir: str, k: int) -> tuple[np.ndarray, ...]:
+    """
+    Build the FM-index arrays of ref (which must end in '$') with a partial suffix array
+    interval of k, or load them from cache_dir if this reference was indexed before. Each
+    array is kept as its own .npy file so it can be memory mapped back in at no cost.
+    Returns (bwt_arr, first_occurrences, is_sampled, psa_values, checkpoint_arrs, ranks).
+    """
+    C = 5
+    key = f"{hashlib.sha1(ref.encode('ascii')).hexdigest()[:16]}_k{k}_C{C}"
+    index_dir = os.path.join(cache_dir, key)
+    if os.path.isdir(index_dir):
+        return tuple(np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r') for name in INDEX_ARRAYS)
+    sa = suffix_array(ref) # sorted once, for both the bwt and the partial suffix array
+    bwt_arr = encode_bwt(burrows_wheeler_transform(ref, sa))
+    is_sampled, psa_values = partial_suffix_arrs(partial_suffix_array(sa, k), len(bwt_arr))
+    index = (bwt_arr, compute_first_occurrences(bwt_arr), is_sampled, psa_values,
+             compute_checkpoint_arrs(bwt_arr), compute_rank_arr(bwt_arr))
+    # write into a scratch directory and rename it, so a half written index is never loaded
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = f"{index_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name, arr in zip(INDEX_ARRAYS, index):
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), arr)
+    try:
+        os.rename(tmp_dir, index_dir)
+    except OSError: # another process finished the same index first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return index
 
 ### FASTQ PARSING
 
-def parse_fastq(fastq_path: str) -> List[Tuple[str, str, List[int]]]:
+def parse_fastq(fastq_path: str) -> Iterator[Tuple[str, str, bytes]]:
     """
-    Parse a FASTQ file and return a list of tuples where each tuple contains the
-    sequence ID, the sequence itself, and the quality scores.
+    Stream a FASTQ file, yielding one tuple per record that contains the sequence ID,
+    the sequence itself, and the quality scores. Records are read lazily by dnaio, and the
+    quality scores are kept as the raw phred+33 bytes (np.frombuffer(q, np.uint8) - 33
+    gives the integer scores when needed).
     
     :param fastq_path: Path to the FASTQ file
-    :return: A list of tuples where each tuple contains the sequence ID, the sequence itself, and the quality scores
+    :return: An iterator of tuples where each tuple contains the sequence ID, the sequence itself, and the quality scores
     """
-    fastq_list = []
-    with open(fastq_path, "r") as handle:
-        for record in SeqIO.parse(handle, "fastq"):
-            fastq_list.append((record.id, str(record.seq), record.letter_annotations["phred_quality"]))
-    return fastq_list
+    with dnaio.open(fastq_path) as reader:
+        for record in reader:
+            yield record.id, record.sequence, record.qualities_as_bytes()
 
 def parse_reference_genome(fasta_path: str) -> Tuple[str, str]:
     """
     Parse a FASTA file containing a reference genome and return a tuple containing
-    the sequence ID and the sequence itself.
+    the sequence ID and the sequence itself. pyfastx indexes the FASTA (a .fxi file next
+    to it) so later runs get random access without re-reading the whole file.
 
     :param fasta_path: Path to the FASTA file
     :return: A tuple containing the sequence ID and the sequence itself
     """
-    with open(fasta_path, "r") as handle:
-        for record in SeqIO.parse(handle, "fasta"):
-            return record.id, str(record.seq)
+    record = pyfastx.Fasta(fasta_path, build_index=True)[0]
+    return record.name, record.seq
 
 ### RANDOM SEQUENCE DATASET GENERATION
 
+_rng = np.random.default_rng()
+_LUT = np.frombuffer(b'ACGT', dtype=np.uint8) # base code -> ascii byte
+
 def random_sequence(length: int) -> str:
     """
     Generate a random DNA sequence of the specified length.
@@ -290,8 +500,7 @@ def random_sequence(length: int) -> str:
     :param length: The length of the sequence
     :return: A random DNA sequence
     """
-    import random
-    return ''.join(random.choices('ACGT', k=length))
+    return _LUT[_rng.integers(0, 4, size=length, dtype=np.uint8)].tobytes().decode('ascii')
 
 def random_quality_scores(length: int) -> List[int]:
     """
@@ -300,8 +509,7 @@ def random_quality_scores(length: int) -> List[int]:
     :param length: The length of the sequence
     :return: A list of random quality scores
     """
-    import random
-    return [random.randint(0, 40) for _ in range(length)]
+    return _rng.integers(0, 41, size=length, dtype=np.int8).tolist()
 
 def random_id(length: int) -> str:
     """
@@ -310,8 +518,7 @@ def random_id(length: int) -> str:
     :param length: The length of the sequence ID
     :return: A random sequence ID
     """
-    import random
-    return ''.join(random.choices('ACGT', k=length))
+    return _LUT[_rng.integers(0, 4, size=length, dtype=np.uint8)].tobytes().decode('ascii')
 
 def generate_fasta_file(fasta_path: str, sequence_id: str, sequence: str):
     """
@@ -334,11 +541,12 @@ def generate_fastq_file(fastq_path: str, sequence_id: str, sequence: str, qualit
     :param sequence: The sequence
     :param quality_scores: The quality scores
     """
-    with open(fastq_path, "w") as handle:
-        handle.write(f"@{sequence_id}\n")
-        handle.write(f"{sequence}\n")
-        handle.write("+\n")
-        handle.write("".join(chr(score + 33) for score in quality_scores))
+    with open(fastq_path, "wb") as handle:
+        handle.write(f"@{sequence_id}\n".encode())
+        handle.write(sequence.encode())
+        handle.write(b"\n+\n")
+        handle.write((np.asarray(quality_scores, dtype=np.uint8) + 33).tobytes()) # phred+33 in one buffer
+        handle.write(b"\n")
         
 def main():
     # Define parameters for random sequence and quality scores
@@ -1,4 +1,5 @@
 from .utils import *
+from itertools import chain
 import pysam
 import argparse
 from tqdm import tqdm
@@ -28,12 +29,14 @@ def main():
     parser = argparse.ArgumentParser(description="Run BWA alignment with specified reference genome and FASTQ file.")
     parser.add_argument("reference_genome", type=str, help="Path to the reference genome file")
     parser.add_argument("fastq_file", type=str, help="Path to the FASTQ file")
+    parser.add_argument("-t", "--threads", type=int, default=None, help="Number of worker processes (default: number of cpus)")
     args = parser.parse_args()
     
-    # Parse the FASTQ file
+    # Stream the FASTQ file, peeking at the first read for the read length
     reads = parse_fastq(args.fastq_file)
-    _, first_read, _ = reads[0]
-    read_length = len(first_read)
+    first = next(reads)
+    read_length = len(first[1])
+    reads = chain([first], reads)
     
     # Parse the reference genome
     ref_id, reference = parse_reference_genome(args.reference_genome)
@@ -42,11 +45,8 @@ def main():
     
     #BWT and SA
     K = 5
-    ref_text = str(reference) + '$'
-    bwt, psa = bwt_psa_out(ref_text, K)
-    first_occurrences = compute_first_occurrences(bwt)
-    checkpoint_arrs = compute_checkpoint_arrs(bwt)
-    ranks = compute_rank_arr(bwt)
+    ref_text = reference.tobytes().decode('ascii') + '$'
+    index = build_index(ref_text, K)
     
     #header for the SAM file (based on ref)
     header = {
@@ -56,17 +56,18 @@ def main():
     
     ### PART 3 OF WORKFLOW - WRITE TO SAM FILE
     
+    #seed and extend every read across the worker pool, results come back in read order
+    params = (19, 2, 2, 2, 10, read_length)
+    alignments = align_reads(reads, index, params, args.threads)
+    
     #write to sam FILE
     with pysam.AlignmentFile("output.sam", "w", header=header) as samfile:
-        for read_id, read_seq, qual_scores in tqdm(reads):
-            
-            seed_idxes = generate_seeds(str(read_seq), bwt, 19, psa, first_occurrences, checkpoint_arrs, ranks)
-            best_idx, score, alignment_s, alignment_t = compute_max_seed(str(reference), str(read_seq), seed_idxes, 2, 2, 2, 10, read_length)
+        for (read_id, read_seq, qual_scores), (best_idx, score, alignment_s, alignment_t) in tqdm(alignments):
             
             #create a SAM entry for the aligned read
             a = pysam.AlignedSegment()
             a.query_name = read_id
-            a.query_sequence = read_seq
+            a.query_sequence = read_seq.decode('ascii')
             a.flag = 0
             a.reference_id = 0
             if score != float('-inf'):
@@ -77,7 +78,7 @@ def main():
                 a.reference_start = 0
                 a.mapping_quality = 0
                 a.cigarstring = '0M'
-            a.query_qualities = qual_scores
+            a.query_qualities = pysam.qualitystring_to_array(qual_scores.decode('ascii'))
             
             samfile.write(a)
 
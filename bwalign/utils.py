@@ -1,7 +1,12 @@
-from Bio import SeqIO
-import random
+from collections.abc import Iterable, Iterator
+from itertools import islice
+import mmap
+import multiprocessing
+from multiprocessing import shared_memory
+import numba
 import numpy as np
-import sys
+import os
+from pydivsufsort import divsufsort
 
 """
     File:          utils.py
@@ -27,48 +32,103 @@ def calculate_cigar(alignment_s, alignment_t):
     returns:
         cigar string of alignment between s and t
     """
-    cigar = []
-    match = 0
-    ins = 0
-    del_ = 0
-
-    for s, t in zip(alignment_s, alignment_t):
-        if s == '-' and t != '-':  #del in quer
-            if match > 0:
-                cigar.append(f"{match}M") 
-                match = 0
-            del_ += 1
-        elif s != '-' and t == '-':  #insertion
-            if match > 0:
-                cigar.append(f"{match}M")
-                match = 0
-            ins += 1
-        else:  # Match or mismatch
-            if ins > 0:
-                cigar.append(f"{ins}I")  
-                ins = 0
-            if del_ > 0:
-                cigar.append(f"{del_}D")
-                del_ = 0
-            match += 1
-
-    if match > 0:
-        cigar.append(f"{match}M")
-    if ins > 0:
-        cigar.append(f"{ins}I")
-    if del_ > 0:
-        cigar.append(f"{del_}D")
+    n = min(len(alignment_s), len(alignment_t))
+    if n == 0:
+        return ''
+    gap = ord('-')
+    sa = np.frombuffer(alignment_s.encode('ascii'), dtype=np.uint8)[:n]
+    ta = np.frombuffer(alignment_t.encode('ascii'), dtype=np.uint8)[:n]
+    # 0 = match or mismatch, 1 = insertion, 2 = del in query
+    op = np.where((sa == gap) & (ta != gap), 2, np.where((sa != gap) & (ta == gap), 1, 0))
+    
+    # split into runs of matches and runs of indels, an indel run reports its insertions then its deletions
+    is_match = op == 0
+    starts = np.flatnonzero(np.concatenate(([True], is_match[1:] != is_match[:-1])))
+    lens = np.diff(np.append(starts, n))
+    ins = np.add.reduceat((op == 1).astype(np.int64), starts)
+    del_ = np.add.reduceat((op == 2).astype(np.int64), starts)
 
+    cigar = []
+    for is_m, length, n_ins, n_del in zip(is_match[starts].tolist(), lens.tolist(), ins.tolist(), del_.tolist()):
+        if is_m:
+            cigar.append(f"{length}M")
+            continue
+        if n_ins > 0:
+            cigar.append(f"{n_ins}I")
+        if n_del > 0:
+            cigar.append(f"{n_del}D")
     return ''.join(cigar)
 
+### SEQUENCE ENCODING
+
+NEG_INF = np.int32(-(1 << 30)) # int32 stand-in for -infinity, leaves room to subtract penalties without wrapping
+# base code -> ascii byte. ACGT$ come first, then N and the other IUPAC codes, so the rank structures
+# of a reference only need a column per code up to the largest one it contains. Every other byte
+# keeps its own code too, so any symbol still only matches itself in the DP and can be decoded back.
+SYMBOLS = b'ACGT$NRYKMSWBDHV'
+DECODE = np.frombuffer(SYMBOLS + bytes(b for b in range(256) if b not in SYMBOLS), dtype=np.uint8)
+ENCODE = np.argsort(DECODE).astype(np.uint8) # ascii byte -> base code
+
+def _encode(seq: str) -> np.ndarray:
+    """
+    Encodes a DNA string as one uint8 base code per position (A=0, C=1, G=2, T=3, $=4,
+    N=5, then the other IUPAC codes and any other symbol, see DECODE).
+    
+    args:
+        seq (str): sequence to be encoded
+    
+    returns:
+        uint8 array of base codes of seq
+    """
+    return ENCODE[np.frombuffer(seq.encode('ascii'), dtype=np.uint8)]
+
 ### BANDED ALIGNMENT
 
+@numba.njit(cache=True, fastmath=True)
+def _banded_score_diag(s_arr, t_arr, mr, mmp, indp, bp):
+    """
+    Banded alignment score kernel over encoded sequences, filled one anti-diagonal
+    d = i + j at a time. Cells on a diagonal only depend on the previous two diagonals,
+    so each one is a run of independent max-of-three updates over three rolling buffers.
+    Cell (i, j) sits at slot j - i + bp, the padding slot on each side stays at NEG_INF.
+    """
+    n, m = len(s_arr), len(t_arr)
+    width = 2 * bp + 1
+    d_prev2 = np.full(width, NEG_INF, dtype=np.int32)
+    d_prev1 = np.full(width, NEG_INF, dtype=np.int32)
+    d_cur = np.full(width, NEG_INF, dtype=np.int32)
+    if bp > 0:
+        d_prev1[bp] = 0 # diagonal 0 is the single cell (0, 0)
+    for d in range(1, n + m + 1):
+        d_cur[:] = NEG_INF
+        o_lo = max(-d, d - 2 * n, -bp + 1) # o = j - i, bounded by the grid and the band
+        o_hi = min(d, 2 * m - d, bp - 1)
+        if (d - o_lo) % 2 != 0: # only offsets with the parity of d lie on this diagonal
+            o_lo += 1
+        for o in range(o_lo, o_hi + 1, 2):
+            i = (d - o) // 2
+            j = (d + o) // 2
+            k = o + bp
+            if i == 0:
+                d_cur[k] = j * (-indp)
+            elif j == 0:
+                d_cur[k] = i * (-indp)
+            else:
+                match = mr if s_arr[i-1] == t_arr[j-1] else -mmp
+                d_cur[k] = max(d_prev1[k+1] - indp, d_prev1[k-1] - indp, d_prev2[k] + match)
+        d_prev2, d_prev1, d_cur = d_prev1, d_cur, d_prev2
+    if n + m == 0: # (0, 0) scores 0 whatever the band
+        return np.int32(0)
+    if abs(m - n) >= bp:
+        return NEG_INF
+    return d_prev1[m - n + bp]
+
 def banded_alignment(mr: int, mmp: int, indp: int, bp: int, s: str, t: str) -> float:
     """
     Calculates the maximal banded alignment SCORE between strings s and t given
     alignment parameters.
     
-    O(n * m) runtime where n = len(s), m = len(t)
+    O(n * bp) runtime where n = len(s), as only the cells inside the band are computed
     
     args:
         mr (int): reward for a match between two bases in the alignment
@@ -82,38 +142,64 @@ def banded_alignment(mr: int, mmp: int, indp: int, bp: int, s: str, t: str) -> f
         best alignment score of all alignments between s and t, returns float('-inf')
         if no alignment is possible given the parameters
     """
-    l = np.full((len(s)+1,len(t)+1), -np.inf)
-    for i in range(0, len(s) + 1):
-        for j in range(0, len(t) + 1):
-            if i == 0 and j == 0:
-                l[i,j] = 0
-                continue
-            if abs(j-i) < bp:
-                if i == 0:
-                    l[i,j] = j * (-indp)
-                    continue
-                if j == 0:
-                    l[i,j] = i * (-indp)
-                    continue
-                match = -mmp
-                if s[i-1] == t[j-1]:
-                    match = mr
-                l[i,j] = max(l[i-1][j] - indp, l[i][j-1] - indp, l[i-1][j-1] + match)
-            else:
-                continue
-    score = l[len(s),len(t)]
-    if score > float('-inf'):
-        return int(l[len(s),len(t)])
+    score = _banded_score_diag(_encode(s), _encode(t), mr, mmp, indp, bp)
+    if score > NEG_INF:
+        return int(score)
     else:
         return float('-inf')
 
+# backtrack pointers, 0 marks a cell outside the band
+BT_D = 1 # deletion, step up
+BT_R = 2 # insertion, step left
+BT_DR = 3 # match or mismatch, step diagonally
+
+@numba.njit(cache=True)
+def _banded_fill_bt(s_arr, t_arr, mr, mmp, indp, bp):
+    """
+    Banded alignment kernel that also records backtrack pointers. Pointers are stored
+    band-relative: the pointer of cell (i+1, j+1) lives at b[i, j - i + bp], so b only
+    takes n * (2 * bp + 1) bytes. Scores are kept for the band of the previous and the
+    current row only.
+    """
+    n, m = len(s_arr), len(t_arr)
+    width = 2 * bp + 1
+    prev = np.full(width, NEG_INF, dtype=np.int32) # score rows, band-relative like b
+    cur = np.full(width, NEG_INF, dtype=np.int32)
+    b = np.zeros((n, width), dtype=np.uint8) # backtrack matrix
+    for j in range(0, min(m, bp) + 1):
+        prev[j + bp] = j * (-indp) # in this case, an empty string s has j indels with t.
+    for i in range(1, n + 1):
+        cur[:] = NEG_INF
+        if i <= bp:
+            cur[bp - i] = i * (-indp)
+        for j in range(max(1, i-bp+1), min(m, i+bp-1) + 1):
+            k = j - i + bp
+            match = mr if s_arr[i-1] == t_arr[j-1] else -mmp
+            up, left, diag = prev[k+1] - indp, cur[k-1] - indp, prev[k] + match
+            best = max(up, left, diag)
+            cur[k] = best
+            if best == up:
+                b[i-1, k] = BT_D
+            elif best == left:
+                b[i-1, k] = BT_R
+            else:
+                b[i-1, k] = BT_DR
+        prev, cur = cur, prev
+    if n == 0: # the first row and column are not limited to the band
+        return np.int32(m * (-indp)), b
+    if m == 0:
+        return np.int32(n * (-indp)), b
+    if abs(m - n) >= bp:
+        return NEG_INF, b
+    return prev[m - n + bp], b
+
 def BandedAlignmentWithBackTrack(match_reward: int, mismatch_penalty: int, indel_penalty: int,
                     band_parameter: int, s: str, t: str) -> tuple[int, str, str]:
     """
     Calculates the maximal banded alignment SCORE along with the ALIGNMENTS THEMSELVES
     between strings s and t given alignment parameters.
     
-    O(n * m) runtime where n = len(s), m = len(t)
+    O(n * bp) runtime and backtrack memory where n = len(s)
     
     args:
         mr (int): reward for a match between two bases in the alignment
@@ -128,217 +214,164 @@ def BandedAlignmentWithBackTrack(match_reward: int, mismatch_penalty: int, indel
         if no alignment is possible given the parameters
         - returns the alignment strings of s and t.
     """
-    sys.setrecursionlimit(1500)
-    l = [[float('-inf')] * (len(t) + 1) for _ in range(len(s) + 1)] # score matrix
-    b = [[None] * (len(t)) for _ in range(len(s))] # backtrack matrix
-    for i in range(0, len(s) + 1):
-        for j in range(0, len(t) + 1):
-            if i == 0 and j == 0:
-                l[i][j] = 0
-            if i == 0:
-                l[i][j] = j * (-indel_penalty) # in this case, an empty string s has j indels with t.
-                continue
-            if j == 0:
-                l[i][j] = i * (-indel_penalty)
-                continue
-            if abs(j-i) < band_parameter:
-                match = -mismatch_penalty
-                if s[i-1] == t[j-1]:
-                    match = match_reward
-                l[i][j] = max(l[i-1][j] - indel_penalty, l[i][j-1] - indel_penalty, l[i-1][j-1] + match)
-                if l[i][j] == l[i-1][j] - indel_penalty:
-                    b[i-1][j-1] = 'd'
-                elif l[i][j] == l[i][j-1] - indel_penalty:
-                    b[i-1][j-1] = 'r'
-                elif l[i][j] == l[i-1][j-1] + match:
-                    b[i-1][j-1] = 'dr'
-            else:
-                continue
+    score, b = _banded_fill_bt(_encode(s), _encode(t), match_reward, mismatch_penalty, indel_penalty, band_parameter)
     s_align, t_align = backtrack(b, s, t, len(s) - 1, len(t) - 1, band_parameter)
-    return l[len(s)][len(t)], s_align, t_align
+    if score > NEG_INF:
+        return int(score), s_align, t_align
+    return float('-inf'), s_align, t_align
 
-def backtrack(b: list[list[str]], s: str, t: str, i: int, j: int, band_parameter: int) -> tuple[str, str]:
+def backtrack(b: np.ndarray, s: str, t: str, i: int, j: int, band_parameter: int) -> tuple[str, str]:
     """
     Traces alignment using backtracking matrix b from banded alignment in order to
-    build the alignments of s and t backwards.
+    build the alignments of s and t backwards. Walks the matrix iteratively, so
+    the alignment length is not bounded by the recursion limit.
     
     args:
-        b (list[list[str]]): backtracking matrix of pointers with (up, down, diag) ptrs
+        b (np.ndarray): band-relative backtracking matrix of (up, left, diag) ptrs
         s (str): first aligned string
         t (str): second aligned string
         i (int): current index in s
         j (int): current index in t
         band_parameter (int): band width parameter for alignment
     """
-    if i < 0 and j < 0: # if both i and j reach -1 at the same time, we can just return empty string.
-        return '',''
-    elif i < 0: # if i reaches -1 first, need to append the rest of t up to index j to t prime, and a number of '-' equal to the length of that string to s prime.
-        return '-' * (j + 1), t[0:j+1]
-    elif j < 0: # same as i < 0 condition but for j.
-        return s[0:i+1], '-' * (i + 1)
-    elif b[i][j] == 'd' and abs(j-i) < band_parameter:
-        s_prime, t_prime = backtrack(b, s, t, i-1, j, band_parameter)
-        return s_prime + s[i], t_prime + '-'
-    elif b[i][j] == 'r' and abs(j-i) < band_parameter:
-        s_prime, t_prime = backtrack(b, s, t, i, j-1, band_parameter)
-        return s_prime + '-', t_prime + t[j]
-    else:
-        s_prime, t_prime = backtrack(b, s, t, i-1, j-1, band_parameter)
-        return s_prime + s[i], t_prime + t[j]
+    s_bytes, t_bytes = s.encode('ascii'), t.encode('ascii')
+    gap = ord('-')
+    s_prime, t_prime = bytearray(), bytearray() # built back to front, reversed once at the end
+    while i >= 0 and j >= 0:
+        ptr = b[i, j-i+band_parameter] if abs(j-i) < band_parameter else 0
+        if ptr == BT_D:
+            s_prime.append(s_bytes[i])
+            t_prime.append(gap)
+            i -= 1
+        elif ptr == BT_R:
+            s_prime.append(gap)
+            t_prime.append(t_bytes[j])
+            j -= 1
+        else:
+            s_prime.append(s_bytes[i])
+            t_prime.append(t_bytes[j])
+            i -= 1
+            j -= 1
+    # once one string runs out, the rest of the other one is aligned against gaps
+    s_prime.reverse()
+    t_prime.reverse()
+    if i >= 0:
+        return s[0:i+1] + s_prime.decode('ascii'), '-' * (i + 1) + t_prime.decode('ascii')
+    return '-' * (j + 1) + s_prime.decode('ascii'), t[0:j+1] + t_prime.decode('ascii')
 
 ### SEED EXTENSION
 
-def compute_max_seed(ref: str, read: str, seed_idxes: list[list[int]],
+@numba.njit(cache=True)
+def _best_anchor(ref_arr, read_arr, hits, offsets, mr, mmp, indp, bp, read_length, budget):
+    """
+    Scores every distinct seed window and returns (score, ref_idx, seed) of the best one,
+    ref_idx is -1 if no window has a banded alignment. Seeds of the same read offset against
+    the same window share an anchor (ref_idx - i), only the first seed of each anchor is
+    aligned, in the order the seeds come in so ties still go to the first. A negative budget
+    turns the mismatch budget off.
+    """
+    n_hits = len(hits)
+    anchors = np.empty(n_hits, dtype=np.int64)
+    seeds = np.empty(n_hits, dtype=np.int64)
+    for i in range(len(offsets) - 1):
+        for h in range(offsets[i], offsets[i+1]):
+            anchors[h] = hits[h] - i
+            seeds[h] = i
+    order = np.argsort(anchors, kind='mergesort') # stable, so the first seed of an anchor comes first
+    is_first = np.zeros(n_hits, dtype=np.bool_)
+    for q in range(n_hits):
+        if q == 0 or anchors[order[q]] != anchors[order[q-1]]:
+            is_first[order[q]] = True
+
+    best_score, best_idx, best_seed = NEG_INF, -1, -1
+    for h in range(n_hits):
+        anchor = anchors[h]
+        if not is_first[h] or anchor < 0:
+            continue
+        ref_segment = ref_arr[anchor:anchor + read_length]
+        if len(ref_segment) == len(read_arr): # gapless prefilter
+            mismatches = 0
+            for p in range(len(read_arr)):
+                if ref_segment[p] != read_arr[p]:
+                    mismatches += 1
+            if mismatches == 0: # nothing can score higher than an exact match
+                return np.int32(mr * len(read_arr)), hits[h], seeds[h]
+            if budget >= 0 and mismatches > budget:
+                continue
+        score = _banded_score_diag(ref_segment, read_arr, mr, mmp, indp, bp)
+        if score > NEG_INF and score > best_score:
+            best_score, best_idx, best_seed = np.int32(score), hits[h], seeds[h]
+    return best_score, best_idx, best_seed
+
+def compute_max_seed(ref_arr: np.ndarray, read: str, seed_idxes: tuple[np.ndarray, np.ndarray],
                      match_reward: int, mismatch_penalty: int,
                      indel_penalty: int, band_width: int,
-                     read_length: int) -> tuple[int, int, str, str]:
+                     read_length: int, mismatch_budget: int = None) -> tuple[int, int, str, str]:
     """
     Generates the best scoring seed (based on banded alignment score) of all seeds
     in a seed list of indexes. Returns that seed index, along with the score, and
     the alignments themselves.
     
+    Every candidate segment is first compared to the read without gaps, which is far
+    cheaper than the banded alignment. A segment matching the read exactly has the best
+    possible score, so the search stops there. If a mismatch budget is given, segments
+    with more mismatches than the budget are skipped without being aligned.
+    
     args:
-        ref (str): reference genome
+        ref_arr (np.ndarray): encoded reference genome, see build_index
         read (str): read being aligned to reference
-        seed_idxes (list[list[int]]): list of all positions in the genome where each
-                                      position in the read found an exact kmer match
+        seed_idxes (tuple[np.ndarray, np.ndarray]): all positions in the genome where each
+                                      position in the read found an exact kmer match, in
+                                      the CSR layout returned by generate_seeds
         match_reward (int): reward for a match of bases in the banded alignment
         mismatch_penalty (int): penalty for mismatch of bases in alignment
         indel_penalty (int): penalty for insertion or deletion in alignment
         band_width (int): band parameter for alignment
         read_length (int): length of the read being aligned
+        mismatch_budget (int): if set, the most gapless mismatches a segment may have to
+                               be aligned at all
     """
-    if len(seed_idxes) == 0:
+    hits, offsets = seed_idxes
+    if len(offsets) == 1: # no kmers, the read is shorter than k
         return None
-    best_score = float('-inf')
-    best_idx = -1
-    best_seed = -1
-    for i in range(0, len(seed_idxes)):
-        for ref_idx in seed_idxes[i]:
-            ref_segment = ref[ref_idx - i:ref_idx - i + read_length]
-            score = banded_alignment(match_reward, mismatch_penalty, indel_penalty, band_width,
-                                            ref_segment, read)
-            if score > best_score:
-                best_score = score
-                best_idx = ref_idx
-                best_seed = i
-    best_ref_seg = ref[best_idx - best_seed:best_idx - best_seed + read_length]
+    read_arr = _encode(read) # every reference segment is a view of ref_arr
+    budget = -1 if mismatch_budget is None else mismatch_budget
+    score, best_idx, best_seed = _best_anchor(ref_arr, read_arr, hits, offsets, match_reward, mismatch_penalty,
+                                              indel_penalty, band_width, read_length, budget)
+    best_score = int(score) if best_idx >= 0 else float('-inf')
+    best_ref_seg = DECODE[ref_arr[best_idx - best_seed:best_idx - best_seed + read_length]].tobytes().decode('ascii')
     _, s_align, t_align = BandedAlignmentWithBackTrack(match_reward, mismatch_penalty, indel_penalty, band_width,
                                                               best_ref_seg, read)
     return best_idx, best_score, s_align, t_align
 
 ### SEED GENERATION
 
-# SUFFIX ARRAY CONSTRUCTION
+CHECKPOINT_INTERVAL = 32 # rows between checkpoints, a sparser table stays in cache at the cost of a short rescan
 
-class suffix:
-    """
-    Class built to store suffix array indices, conserving memory.
-    """
-    def __init__(self):
-        self.index = 0
-        self.rank = [0,0]
-
-def get_rank(char: str) -> int:
-    """
-    Converts the given char to its ascii value, then subtracts 'a' from it to get a
-    clean rank value.
-    
-    args:
-        char (str): character to be converted
-    
-    returns:
-        rank of the given char
-    """
-    return ord(char) - ord('a')
+# SUFFIX ARRAY CONSTRUCTION
 
-def suffix_array(text: str) -> list[int]:
+def suffix_array(text: str) -> np.ndarray:
     """
-    Generates the suffix array of a given database string text using O(n(logn)^2)
-    time complexity and O(n) space. To improve to O(nlogn), can use radix sort to
-    sort the suffix lists. (n = len(text))
-    
-    Algorithm ripped from:
-    https://www.geeksforgeeks.org/suffix-array-set-2-a-nlognlogn-algorithm/
+    Generates the suffix array of a given database string text with libdivsufsort
+    (through pydivsufsort), in O(nlogn) time and O(n) space. (n = len(text))
     
     args:
         text (str): text to be processed
     
     returns:
-        suffix array of text
+        suffix array of text, as an int array
     """
-    
-    # get the intial array of suffixes before starting to loop through and rank them.
-    suffixes = [suffix() for _ in range(len(text))]
-    
-    # initial (k=2) ranking of suffixes
-    for i in range(0, len(text)):
-        suffixes[i].index = i
-        suffixes[i].rank[0] = get_rank(text[i])
-        if (i + 1) < len(text):
-            suffixes[i].rank[1] = get_rank(text[i+1])
-        else:
-            suffixes[i].rank[1] = -1
-    
-    # https://stackoverflow.com/questions/9376384/sort-a-list-of-tuples-depending-on-two-elements
-    suffixes = sorted(suffixes, key=lambda element: (element.rank[0], element.rank[1]))
-    
-    ind = [0] * len(text) # array to keep track of indices while computing ranks
-    
-    k = 4
-    while (k < 2 * len(text)):
-         
-        # Assigning rank and index 
-        # values to first suffix
-        rank = 0
-        prev_rank = suffixes[0].rank[0]
-        suffixes[0].rank[0] = rank
-        ind[suffixes[0].index] = 0
- 
-        # Assigning rank to suffixes
-        for i in range(1, len(text)):
-             
-            # If first rank and next ranks are 
-            # same as that of previous suffix in
-            # array, assign the same new rank to 
-            # this suffix
-            if (suffixes[i].rank[0] == prev_rank and
-                suffixes[i].rank[1] == suffixes[i - 1].rank[1]):
-                prev_rank = suffixes[i].rank[0]
-                suffixes[i].rank[0] = rank
-                 
-            # Otherwise increment rank and assign    
-            else:  
-                prev_rank = suffixes[i].rank[0]
-                rank += 1
-                suffixes[i].rank[0] = rank
-            ind[suffixes[i].index] = i
- 
-        # Assign next rank to every suffix
-        for i in range(len(text)):
-            nextindex = suffixes[i].index + k // 2
-            suffixes[i].rank[1] = suffixes[ind[nextindex]].rank[0] if (nextindex < len(text)) else -1
- 
-        # Sort the suffixes according to
-        # first k characters
-        suffixes = sorted(suffixes, key = lambda element: (element.rank[0], element.rank[1]))
- 
-        k *= 2
-        
-    to_return = []
-    for i in range(0, len(text)):
-        to_return.append(suffixes[i].index)
-        
-    return to_return
+    return divsufsort(text.encode('ascii'))
 
-def partial_suffix_array(sa: list[int], k: int) -> dict[int, int]:
+def partial_suffix_array(sa: np.ndarray, k: int) -> np.ndarray:
     """
-    Generate a partial suffix array for the given text and interval K.
+    Generate a partial suffix array for the given text and interval K. The partial
+    suffix array is dense: row i holds sa[i] if sa[i] % k == 0, and -1 otherwise.
     
     Runs in O(n) w.r.t. suffix array size.
     
     args:
-        sa (list[int]): suffix array to be converted
+        sa (np.ndarray): suffix array to be converted
         k (int): partial suffix array parameter for conversion - larger k gives
                  a smaller partial suffix array, but increases runtime in future
                  calculations using the partial suffix array
@@ -346,15 +379,11 @@ def partial_suffix_array(sa: list[int], k: int) -> dict[int, int]:
     returns:
         partial suffix array of size depending on k value
     """
-    partial = dict()
-    for idx in sa:
-        if sa[idx] % k == 0:
-            partial[idx] = sa[idx]
-    return partial
+    return np.where(sa % k == 0, sa, -1).astype(np.int32)
 
 ## BWT creation
 
-def bwt_from_suffix_array(text: str, suffix_array: list[int]) -> str:
+def bwt_from_suffix_array(text: str, suffix_array: np.ndarray) -> tuple[str, np.ndarray]:
     """
     Creates a burrows-wheeler transform of a given text using its suffix array.
     
@@ -362,97 +391,99 @@ def bwt_from_suffix_array(text: str, suffix_array: list[int]) -> str:
     
     args:
         text (str): text to be transformed
-        suffix_array (list[int]): suffix array of text
+        suffix_array (np.ndarray): suffix array of text
     
     returns:
-        burrows-wheeler transform of text
+        burrows-wheeler transform of text, both as a string and encoded as one uint8
+        base code per position (see _encode)
     """
-    bwt = []
-    for idx in suffix_array:
-        bwt.append(text[idx-1])
-    return ''.join(bwt)
+    text_arr = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+    bwt_bytes = text_arr[suffix_array - 1] # index -1 wraps to the last character
+    bwt_arr = ENCODE[bwt_bytes]
+    return bwt_bytes.tobytes().decode('ascii'), bwt_arr
 
-def bwt_psa_out(text: str, k: int) -> tuple[str, dict[int, int]]:
+def bwt_psa_out(text: str, k: int) -> tuple[str, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     sa = suffix_array(text)
-    bwt = bwt_from_suffix_array(text, sa)
+    bwt, bwt_arr = bwt_from_suffix_array(text, sa)
     psa = partial_suffix_array(sa, k)
-    return (bwt, psa)
+    ranks, checkpoint_arrs = compute_rank_and_checkpoint_arrs(bwt_arr)
+    return (bwt, bwt_arr, psa, ranks, checkpoint_arrs)
 
-def compute_rank_arr(bwt: str) -> list[int]:
+def compute_first_occurrences(bwt_arr: np.ndarray) -> np.ndarray: # the mapping of c in C is the row at which the character c appears in the first column for the first time.
     """
-    This function generates the rank of each position in the last column given by the bwt.
-    The rank is the number of occurrences of whatever character is at that position, up to
-    that position. This can be done in linear time by iterating through the bwt. The ranks
-    will be returned in the form of a list of ranks, obviously indices will be in-built.
+    Generate an int32 array where each base code is mapped to the index in first column
+    where these characters first appeared. In other words because the first column is in
+    alphabetical order, a cumulative sum of the count of each symbol in the last column, taken
+    in ascii order ($ < A < C < G < N < T ...), gives the row where each symbol starts.
     
     Runs in O(n), where n is len(bwt)
     
     args:
-        bwt (str): burrows-wheeler transform of our string
+        bwt_arr (np.ndarray): encoded burrows-wheeler transform of our string
     
     returns:
-        rank array of the burrows wheeler transform
-    """
-    rank = []
-    counts = dict()
-    for char in bwt:
-        if char not in counts: counts[char] = 0
-        counts[char] += 1
-        rank.append(counts[char])
-    return rank
+        first occurrences array of the burrows wheeler transform, indexed by base code
+    """
+    counts = np.bincount(bwt_arr, minlength=256).astype(np.int32)
+    lexical = ENCODE[np.arange(256)] # base codes in ascii order, '$' sorts first but is encoded after ACGT
+    first_occ = np.empty(256, dtype=np.int32)
+    first_occ[lexical] = np.concatenate(([0], np.cumsum(counts[lexical])[:-1]))
+    return first_occ
+
+@numba.njit(cache=True)
+def _rank_and_checkpoint_arrs(bwt_arr, C, n_symbols):
+    rank = np.empty(len(bwt_arr), dtype=np.int32)
+    checkpoints = np.zeros(((len(bwt_arr) + C - 1) // C, n_symbols), dtype=np.int32)
+    counts = np.zeros(n_symbols, dtype=np.int32)
+    for i in range(0, len(bwt_arr)):
+        counts[bwt_arr[i]] += 1
+        rank[i] = counts[bwt_arr[i]]
+        if i % C == 0:
+            checkpoints[i // C] = counts
+    return rank, checkpoints
 
-def compute_first_occurrences(bwt: str) -> dict[str, int]: # the mapping of c in C is the row at which the character c appears in the first column for the first time.
+def compute_rank_and_checkpoint_arrs(bwt_arr: np.ndarray, C: int = CHECKPOINT_INTERVAL) -> tuple[np.ndarray, np.ndarray]:
     """
-    Generate a dict where each 'character' is mapped to the index in first column where
-    these characters first appeared. In other words because the first column is in alphabetical
-    order, we can count the ascii code of each character in the last column, then iterate
-    from 0 to 255 to get the count of each ascii character in ascending lexicographic order.
-    This is done in linear time.
+    Generates both rank structures of the bwt in a single pass over it.
+    
+    The rank array holds the rank of each position in the last column: the number of
+    occurrences of whatever character is at that position, up to that position.
+    
+    The checkpoint arrays are similar to ranks, but instead the row stored contains the rank
+    of every symbol up to that index, if the index % C is 0. Row i // C holds the symbol
+    counts of bwt[0:i+1], one int32 column per base code up to the largest code in the bwt
+    (ACGT$, and N onwards only if the reference has them). More memory efficient.
     
     Runs in O(n), where n is len(bwt)
     
     args:
-        bwt (str): burrows-wheeler transform of our string
+        bwt_arr (np.ndarray): encoded burrows-wheeler transform of our string
+        C (int): interval between checkpoints
     
     returns:
-        first occurrences dict of the burrows wheeler transform
-    """
-    C = dict()
-    counts = [0 for _ in range(256)]
-    for char in bwt:
-        C[char] = 0
-        counts[ord(char)] += 1
-    curr_idx = 0
-    for i in range(0,256):
-        if counts[i] != 0:
-            C[chr(i)] = curr_idx
-        for _ in range(counts[i]):
-            curr_idx += 1
-    return C
-
-def compute_checkpoint_arrs(bwt: str) -> dict[int, list[int]]:
-    """
-    Similar to ranks, but instead the list stored contains the rank of every character up to
-    that index, if the index % C is 0. More memory efficient.
-    
-    Runs in O(n), where n is len(bwt)
+        rank array and checkpoint arrays of the burrows-wheeler transform
+    """
+    n_symbols = max(5, int(bwt_arr.max(initial=0)) + 1) # always a column for each of ACGT$
+    return _rank_and_checkpoint_arrs(bwt_arr, C, n_symbols)
+
+def build_index(text: str, k: int) -> dict[str, np.ndarray]:
+    """
+    Builds every array the seed and extend steps need from the reference, in one place.
     
     args:
-        bwt (str): burrows-wheeler transform of our string
+        text (str): reference genome, terminated by '$'
+        k (int): partial suffix array parameter
     
     returns:
-        checkpoint arrays dict of the burrows-wheeler transform
+        dict of the encoded bwt (bwt_arr), partial suffix array (psa), first occurrences,
+        checkpoint arrays, rank array, and the encoded reference without its '$' (ref_arr)
     """
-    C = 5
-    ranks = dict()
-    rank = [0 for _ in range(256)]
-    for i in range(0, len(bwt)):
-        rank[ord(bwt[i])] += 1
-        if i % C == 0:
-            ranks[i] = rank[:]
-    return ranks
+    _, bwt_arr, psa, ranks, checkpoint_arrs = bwt_psa_out(text, k)
+    return {'bwt_arr': bwt_arr, 'psa': psa, 'first_occurrences': compute_first_occurrences(bwt_arr),
+            'checkpoint_arrs': checkpoint_arrs, 'ranks': ranks, 'ref_arr': _encode(text[:-1])}
 
-def compute_rank(bwt: str, idx: int, ranks: dict[int, list[int]], symbol: str, C: int) -> int: # idx can be either top or bot
+@numba.njit(cache=True)
+def compute_rank(bwt_arr: np.ndarray, idx: int, ranks: np.ndarray, symbol: int, C: int) -> int: # idx can be either top or bot
     """
     Computes the rank of a given symbol within the burrows-wheeler transform using
     auxiliary data structures. In this case, we are not to confuse rank with the
@@ -461,26 +492,45 @@ def compute_rank(bwt: str, idx: int, ranks: dict[int, list[int]], symbol: str, C
     positions up to and including j. This technique uses the pre-computed checkpoint
     arrays, now referred to as RANKS.
     
-    Runs in O(1).
+    Runs in O(C).
     
     args:
-        bwt (str): burrows-wheeler transform of string
+        bwt_arr (np.ndarray): encoded burrows-wheeler transform of string
         idx (int): index of character symbol
-        ranks (dict[int, list[int]]): pre-computed rank (checkpoint) arrays
-        symbol (str): character we are attempting to rank
+        ranks (np.ndarray): pre-computed rank (checkpoint) arrays
+        symbol (int): base code of the character we are attempting to rank
         C (int): constant defined for both partial suffix array and checkpoint arrays
     
     returns:
         rank of character symbol
     """
-    idx_dist_from_chkpnt = idx % C
-    idx_rank = ranks[idx - idx_dist_from_chkpnt][ord(symbol)]
-    for j in range(idx - idx_dist_from_chkpnt + 1, idx + 1):
-        if bwt[j] == symbol:
+    chkpnt = idx - idx % C
+    idx_rank = ranks[chkpnt // C, symbol]
+    for j in range(chkpnt + 1, idx + 1): # rescan from the checkpoint
+        if bwt_arr[j] == symbol:
             idx_rank += 1
     return idx_rank
 
-def bw_better_match_pattern(bwt: str, pattern: str, first_occurrences: dict[str,int], ranks: list[list[int]]) -> tuple[int,int]:
+@numba.njit(cache=True)
+def _match_pattern(bwt_arr, pattern_arr, first_occ, ranks, C):
+    top = 0
+    bot = len(bwt_arr) - 1
+    for i in range(len(pattern_arr) - 1, -1, -1):
+        symbol = pattern_arr[i]
+        if symbol >= ranks.shape[1]: # in the case the symbol is not in text at all
+            return 0, 0
+        top_rank = compute_rank(bwt_arr, top, ranks, symbol, C) # use checkpoint arrs to get the rank
+        bot_rank = compute_rank(bwt_arr, bot, ranks, symbol, C)
+        marker = bwt_arr[top] == symbol
+        top = first_occ[symbol] + top_rank
+        if marker:
+            top -= 1
+        bot = first_occ[symbol] + bot_rank - 1
+        if bot - top < 0:
+            return 0, 0
+    return top, bot + 1
+
+def bw_better_match_pattern(bwt_arr: np.ndarray, pattern: str, first_occurrences: np.ndarray, ranks: np.ndarray) -> tuple[int,int]:
     """
     Matches a pattern and finds a range of its possible indices in last col of bwt using 
     auxiliary data structures that we have precomputed
@@ -488,35 +538,31 @@ def bw_better_match_pattern(bwt: str, pattern: str, first_occurrences: dict[str,
     Runs in O(|pattern|)
     
     args:
-        bwt (str): burrows-wheeler transform of text
+        bwt_arr (np.ndarray): encoded burrows-wheeler transform of text
         pattern (str): pattern we are matching to text
-        first_occurrences (dict[str,int]): first-occurences pre-computed data structure
+        first_occurrences (np.ndarray): first-occurences pre-computed data structure
         ranks: pre-computed ranks data structure
     
     returns:
         a range of indices in last col of bwt where the pattern could match in text
     """
-    C = 5
-    top = 0
-    bot = len(bwt) - 1
-    for i in range(len(pattern) - 1, -1, -1):
-        symbol = pattern[i]
-        if symbol not in first_occurrences: # in the case the symbol is not in text at all
-            return (0,0)
-        top_rank = compute_rank(bwt, top, ranks, symbol, C) # use checkpoint arrs to get the rank
-        bot_rank = compute_rank(bwt, bot, ranks, symbol, C)
-        marker = False
-        if bwt[top] == symbol:
-            marker = True
-        top = first_occurrences[symbol] + top_rank
-        if marker:
-            top -= 1
-        bot = first_occurrences[symbol] + bot_rank - 1
-        if bot - top < 0:
-            return (0,0)
-    return (top, bot + 1)
+    C = CHECKPOINT_INTERVAL
+    return _match_pattern(bwt_arr, _encode(pattern), first_occurrences, ranks, C)
+
+@numba.njit(cache=True)
+def _recover(start, end, partial_s_array, bwt_arr, rank, occurrences):
+    pattern_idxes = np.empty(end - start, dtype=np.int64)
+    for i in range(start, end):
+        p = i
+        plus_count = 0
+        while partial_s_array[p] < 0: # walk back to the nearest sampled row
+            predecessor = bwt_arr[p]
+            p = occurrences[predecessor] + rank[p] - 1
+            plus_count += 1
+        pattern_idxes[i - start] = (partial_s_array[p] + plus_count) % len(bwt_arr)
+    return pattern_idxes
 
-def compute_idxes_from_top_bot(start: int, end: int, partial_s_array: dict[int, int], bwt: str, rank: list[int], occurrences: list[int]) -> list[int]:
+def compute_idxes_from_top_bot(start: int, end: int, partial_s_array: np.ndarray, bwt_arr: np.ndarray, rank: np.ndarray, occurrences: np.ndarray) -> list[int]:
     """
     Uses the start and end indices we have computed to calculate a list of exact
     indices where the pattern matches in text
@@ -526,86 +572,182 @@ def compute_idxes_from_top_bot(start: int, end: int, partial_s_array: dict[int,
     args:
         start (int): starting index in last col of bwt where matches can occur
         end (int): ending index in last col of bwt where matches can occur
-        partial_s_array (dict[int, int]): partial suffix array of text
-        bwt (str): burrows-wheeler transform of text
-        rank (list[int]): rank array given by compute_rank_array function
-        occurrences (list[int]): pre-computed first occurrences array
+        partial_s_array (np.ndarray): partial suffix array of text, -1 for unsampled rows
+        bwt_arr (np.ndarray): encoded burrows-wheeler transform of text
+        rank (np.ndarray): rank array given by compute_rank_and_checkpoint_arrs
+        occurrences (np.ndarray): pre-computed first occurrences array
     
     returns:
         list of all indices where the pattern matches in text
     """
-    pattern_idxes = []
-    for i in range(start, end):
-        p = i
-        plus_count = 0
-        while True:
-            predecessor = bwt[p]
-            p = occurrences[predecessor] + rank[p] - 1
-            plus_count += 1
-            if p in iter(partial_s_array.keys()):
-                break
-        pattern_idxes.append((partial_s_array[p] + plus_count) % len(bwt))
-    return pattern_idxes
-
-def generate_seeds(read: str, bwt: str, k: int, psa: dict[int, int],
-                                                first_occurrences: dict[str, int],
-                                                checkpoint_arrs: dict[int, list[int]],
-                                                ranks: list[int]) -> list[list[int]]:
-    """
-    Takes a read and bwt created from reference genome, and generates a list of lists
-    with each index being an index i in the read from 0 to len(read) - k + 1. The corresponding list at each
-    index is a list of exact match indices of the kmer at read[i:i+k] located in the reference
-    genome. Note that even if two kmers are identical, their indices in the read are not.
+    return _recover(start, end, partial_s_array, bwt_arr, rank, occurrences).tolist()
+
+@numba.njit(cache=True)
+def _generate_seeds(read_arr, bwt_arr, k, psa, first_occ, checkpoint_arrs, ranks, C):
+    """
+    Matches and locates every kmer of the encoded read in one call. The hits come back
+    in CSR layout: the hits of the kmer at read[i:i+k] are hits[offsets[i]:offsets[i+1]].
+    """
+    n_kmers = max(len(read_arr) - k + 1, 0)
+    starts = np.empty(n_kmers, dtype=np.int64)
+    offsets = np.zeros(n_kmers + 1, dtype=np.int32)
+    for i in range(n_kmers): # first pass sizes the output
+        start, end = _match_pattern(bwt_arr, read_arr[i:i+k], first_occ, checkpoint_arrs, C)
+        starts[i] = start
+        offsets[i+1] = offsets[i] + end - start
+    hits = np.empty(offsets[n_kmers], dtype=np.int32)
+    for i in range(n_kmers):
+        hits[offsets[i]:offsets[i+1]] = _recover(starts[i], starts[i] + offsets[i+1] - offsets[i],
+                                                 psa, bwt_arr, ranks, first_occ)
+    return hits, offsets
+
+def generate_seeds(read: str, bwt_arr: np.ndarray, k: int, psa: np.ndarray,
+                                                first_occurrences: np.ndarray,
+                                                checkpoint_arrs: np.ndarray,
+                                                ranks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Takes a read and bwt created from reference genome, and generates the seeds of every
+    index i in the read from 0 to len(read) - k + 1. The seeds of index i are the exact match
+    indices of the kmer at read[i:i+k] located in the reference, hits[offsets[i]:offsets[i+1]]
+    in CSR layout. Note that even if two kmers are identical, their indices in the read are not.
+    Every kmer is matched and located inside a single JIT call.
     
     Runs in O(m), where m = len(read)
     
     args:
         read (str): read being processed for seeds
-        bwt (str): burrows-wheeler transform of reference genome
+        bwt_arr (np.ndarray): encoded burrows-wheeler transform of reference genome
         k (int): seed length parameter
-        psa (dict[int,int]): partial suffix array of reference genome
-        first_occurrences (dict[str, int]): first occurrences array of bwt
-        checkpoints_arrs (dict[int, list[int]]): checkpoint arrays of bwt
-        ranks (list[int]): rank arrays of bwt
+        psa (np.ndarray): partial suffix array of reference genome
+        first_occurrences (np.ndarray): first occurrences array of bwt
+        checkpoints_arrs (np.ndarray): checkpoint arrays of bwt
+        ranks (np.ndarray): rank arrays of bwt
         
     returns:
-        a list of lists containing exact match indices for the read in reference
+        (hits, offsets): flat int32 array of exact match indices for the read in reference,
+        and the int32 offsets of each kmer's hits in it
     """
-    seed_idxes = []
-    for i in range(0, len(read) - k + 1):
-        kmer = read[i:i+k]
-        start, end = bw_better_match_pattern(bwt, kmer, first_occurrences, checkpoint_arrs)
-        idxes = compute_idxes_from_top_bot(start, end, psa, bwt, ranks, first_occurrences)
-        seed_idxes.append(idxes)
-    return seed_idxes
+    C = CHECKPOINT_INTERVAL
+    hits, offsets = _generate_seeds(_encode(read), bwt_arr, k, psa, first_occurrences,
+                                    checkpoint_arrs, ranks, C)
+    return hits, offsets
+
+### PARALLEL ALIGNMENT
+
+_WORKER_STATE = dict() # per worker process: numpy views over the shared index and the parameters
+
+def _attach_index(specs: dict[str, tuple[str, tuple, str]], params: tuple) -> None:
+    """
+    Pool initializer. Maps every shared index array into this worker without copying.
+    """
+    segments = []
+    for key, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        segments.append(shm) # keep the mapping alive as long as the worker
+        _WORKER_STATE[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _WORKER_STATE['segments'] = segments
+    _WORKER_STATE['params'] = params
+
+def _align_one(read: str) -> tuple[int, int, str, str]:
+    """
+    Seeds and extends a single read against the index attached to this worker.
+    """
+    state = _WORKER_STATE
+    k, match_reward, mismatch_penalty, indel_penalty, band_width, read_length = state['params']
+    seed_idxes = generate_seeds(read, state['bwt_arr'], k, state['psa'], state['first_occurrences'],
+                                state['checkpoint_arrs'], state['ranks'])
+    return compute_max_seed(state['ref_arr'], read, seed_idxes, match_reward, mismatch_penalty,
+                            indel_penalty, band_width, read_length)
+
+def align_reads(records: Iterable[tuple[str, bytes, bytes]], index: dict[str, np.ndarray], params: tuple,
+                n_workers: int = None, batch_size: int = 4096
+                ) -> Iterator[tuple[tuple[str, bytes, bytes], tuple[int, int, str, str]]]:
+    """
+    Aligns reads in parallel over a pool of worker processes. The index arrays are copied
+    into shared memory blocks once, and every worker maps them in read-only instead of
+    receiving its own pickled copy. Records are pulled from the input on the calling
+    thread, batch_size at a time, so at most one batch is held in memory and the input
+    is never advanced from the pool's own threads. Results are yielded in read order.
+    
+    args:
+        records (Iterable[tuple[str, bytes, bytes]]): (id, sequence, qualities) of the
+                                                     reads to be aligned, as from parse_fastq
+        index (dict[str, np.ndarray]): index of the reference, as built by build_index
+        params (tuple): (k, match_reward, mismatch_penalty, indel_penalty, band_width,
+                        read_length), as taken by generate_seeds and compute_max_seed
+        n_workers (int): number of worker processes, defaults to the number of cpus
+        batch_size (int): number of records read ahead and handed to the pool at once
+    
+    returns:
+        iterator over (record, compute_max_seed result) for every read
+    """
+    records = iter(records)
+    segments = []
+    try:
+        specs = dict()
+        for key, arr in index.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            segments.append(shm)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            specs[key] = (shm.name, arr.shape, arr.dtype.str)
+        with multiprocessing.Pool(n_workers or os.cpu_count(), initializer=_attach_index,
+                                  initargs=(specs, params)) as pool:
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                reads = [read_seq.decode('ascii') for _, read_seq, _ in batch]
+                yield from zip(batch, pool.imap(_align_one, reads, chunksize=64)) # chunks amortize the IPC per read
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
 
 ### FASTQ PARSING
 
-def parse_fastq(fastq_path: str) -> list[tuple[str, str, list[int]]]:
+def parse_fastq(fastq_path: str) -> Iterator[tuple[str, bytes, bytes]]:
     """
-    Parse a FASTQ file and return a list of tuples where each tuple contains the
-    sequence ID, the sequence itself, and the quality scores.
+    Stream a FASTQ file one record at a time, yielding tuples that contain the
+    sequence ID, the sequence itself, and the phred+33 encoded quality string.
+    Records are read four lines at a time and never held in memory together.
     
     :param fastq_path: Path to the FASTQ file
-    :return: A list of tuples where each tuple contains the sequence ID, the sequence itself, and the quality scores
+    :return: An iterator of tuples containing the sequence ID, the sequence bytes, and the quality bytes
     """
-    fastq_list = []
-    with open(fastq_path, "r") as handle:
-        for record in SeqIO.parse(handle, "fastq"):
-            fastq_list.append((record.id, str(record.seq), record.letter_annotations["phred_quality"]))
-    return fastq_list
+    with open(fastq_path, "rb") as handle:
+        while True:
+            header = handle.readline()
+            if not header:
+                break
+            if not header.strip(): # tolerate blank lines between or after records
+                continue
+            seq = handle.readline().rstrip()
+            handle.readline() # '+' separator
+            qual = handle.readline().rstrip()
+            yield header[1:].split()[0].decode('ascii'), seq, qual
 
-def parse_reference_genome(fasta_path: str) -> tuple[str, str]:
+def parse_reference_genome(fasta_path: str) -> tuple[str, np.ndarray]:
     """
-    Parse a FASTA file containing a reference genome and return a tuple containing
-    the sequence ID and the sequence itself.
+    Parse the first record of a FASTA file containing a reference genome and return a tuple
+    containing the sequence ID and the sequence itself, as an uppercase uint8 array of ascii
+    bytes. The file is memory mapped, so the page cache does the reading.
 
     :param fasta_path: Path to the FASTA file
     :return: A tuple containing the sequence ID and the sequence itself
     """
-    with open(fasta_path, "r") as handle:
-        for record in SeqIO.parse(handle, "fasta"):
-            return record.id, str(record.seq)
+    with open(fasta_path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        first_nl = mm.find(b'\n')
+        header = mm[1:first_nl].split()[0].decode('ascii')
+        end = mm.find(b'\n>', first_nl) # only the first record is the reference
+        if end == -1:
+            end = len(mm)
+        seq = mm[first_nl + 1:end].replace(b'\n', b'').replace(b'\r', b'').upper()
+    return header, np.frombuffer(seq, dtype=np.uint8)
+
+_RNG = np.random.default_rng()
+_DNA = np.frombuffer(b'ACGT', dtype=np.uint8) # lookup tables from a random index to an ascii byte
+_QUALITIES = np.frombuffer(b'!"#$%&\'()*+,-./0123456789:;<=>?@ABCDEFGHI', dtype=np.uint8)
+_ID_CHARS = np.frombuffer(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', dtype=np.uint8)
 
 def random_sequence(length: int) -> str:
     """
@@ -614,16 +756,16 @@ def random_sequence(length: int) -> str:
     :param length: The length of the sequence
     :return: A random DNA sequence
     """
-    return ''.join(random.choices('ACGT', k=length))
+    return _DNA[_RNG.integers(0, len(_DNA), size=length, dtype=np.uint8)].tobytes().decode('ascii')
 
-def random_quality_scores(length: int) -> list[int]:
+def random_quality_scores(length: int) -> str:
     """
     Generate random quality scores for a sequence of the specified length.
 
     :param length: The length of the sequence
-    :return: A list of random quality scores
+    :return: A phred+33 string of random quality scores
     """
-    return ''.join(random.choices('!"#$%&\'()*+,-./0123456789:;<=>?@ABCDEFGHI', k=length))
+    return _QUALITIES[_RNG.integers(0, len(_QUALITIES), size=length, dtype=np.uint8)].tobytes().decode('ascii')
 
 def random_id(length: int) -> str:
     """
@@ -632,7 +774,7 @@ def random_id(length: int) -> str:
     :param length: The length of the sequence ID
     :return: A random sequence ID
     """
-    return ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=length))
+    return _ID_CHARS[_RNG.integers(0, len(_ID_CHARS), size=length, dtype=np.uint8)].tobytes().decode('ascii')
 
 def generate_fasta_file(fasta_path: str, sequence_id: str, sequence: str):
     """
@@ -8,10 +8,17 @@ setup(
     author=['Adrian Layer, Nabil Khoury, Yasmin Jabir'],
     license='MIT',
     packages=find_packages(),
-    install_requires=['biopython',
-                      'pysam',
+    install_requires=['pysam',
                       'tqdm',                
+                      'numpy',
+                      'numba',
+                      'pydivsufsort',
                       ],
+    extras_require={'simd': ['parasail',
+                             'dnaio',
+                             'pyfastx',
+                             ],
+                    },
     entry_points={
         'console_scripts': [
             'bwalign=bwalign.main:main',